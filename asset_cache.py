@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""
+Precomputed, compressed HTTP responses for pages and static files.
+"""
+
+import gzip, hashlib, mimetypes, os
+from collections import namedtuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content types worth compressing. Images and woff/woff2 are compressed already.
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'application/vnd.ms-fontobject', 'font/ttf', 'application/x-font-ttf')
+MIN_COMPRESS_SIZE = 256
+
+# digest: hash of the uncompressed body, variants: encoding ('identity', 'gzip', 'br') -> body
+Asset = namedtuple('Asset', ['content_type', 'digest', 'variants'])
+
+
+def make_asset(body, content_type):
+    """
+    Build an Asset holding body and its gzip/brotli variants.
+    """
+    variants = {'identity': body}
+    if len(body) >= MIN_COMPRESS_SIZE and content_type.startswith(COMPRESSIBLE_TYPES):
+        variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            variants['br'] = brotli.compress(body)
+        for encoding in ('gzip', 'br'):
+            if encoding in variants and len(variants[encoding]) >= len(body):
+                del variants[encoding]
+    if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+        content_type += '; charset=UTF-8'
+    digest = hashlib.sha1(body).hexdigest()[:16]
+    return Asset(content_type, digest, variants)
+
+
+def get_etag(asset, encoding):
+    """
+    Strong ETag of one variant. Every encoding gets its own, as the bodies differ.
+    """
+    if encoding == 'identity':
+        return '"{}"'.format(asset.digest)
+    return '"{}-{}"'.format(asset.digest, encoding)
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Check an If-None-Match header against an ETag.
+    """
+    for candidate in (if_none_match or '').split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate in ('*', etag):
+            return True
+    return False
+
+
+def get_version(asset):
+    """
+    Short content hash used in the ?v= query of static URLs.
+    """
+    return asset.digest[:8]
+
+
+def choose_encoding(accept_encoding, variants):
+    """
+    Pick the smallest variant allowed by an Accept-Encoding header.
+    """
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                pass
+        accepted[name.strip().lower()] = q
+    for encoding in ('br', 'gzip'):
+        if encoding in variants and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+class StaticAssets:
+    """
+    Cache of the files below a static folder, reloaded when a file's mtime changes.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._assets = {}
+
+    def get(self, filename):
+        """
+        Return the Asset for filename, or None if it doesn't exist below root.
+        """
+        path = os.path.abspath(os.path.join(self.root, filename))
+        if not path.startswith(self.root + os.sep) or not os.path.isfile(path):
+            return None
+        mtime = os.stat(path).st_mtime
+        try:
+            cached_mtime, asset = self._assets[filename]
+            if cached_mtime == mtime:
+                return asset
+        except KeyError:
+            pass
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        with open(path, 'rb') as fh:
+            asset = make_asset(fh.read(), content_type)
+        self._assets[filename] = (mtime, asset)
+        return asset
+
+    def precompute(self):
+        """
+        Load and compress every file below root. Returns the number of files.
+        """
+        count = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if self.get(os.path.relpath(os.path.join(dirpath, name), self.root)) is not None:
+                    count += 1
+        return count
+
+    def url(self, filename):
+        """
+        URL of a static file including a content hash, so it can be cached forever.
+        """
+        asset = self.get(filename)
+        if asset is None:
+            return '/static/' + filename
+        return '/static/{}?v={}'.format(filename, get_version(asset))
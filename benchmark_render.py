@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure label rendering throughput in-process and with an increasing
+number of render worker processes.
+"""
+
+import argparse, os, time
+
+import brother_ql_web
+from font_helpers import get_fonts
+from render_pool import RenderPool, unpack_image
+
+RENDERERS = {
+    'text':  brother_ql_web.create_label_im,
+    'grocy': brother_ql_web.create_label_grocy,
+}
+
+PRODUCTS = ['Organic whole milk 3.5% fat', 'Wholegrain spaghetti', 'Chopped tomatoes with basil and oregano',
+            'Greek yoghurt', 'Smoked paprika', 'Extra virgin olive oil, cold pressed', 'Basmati rice', 'Oat flakes']
+
+
+def make_contexts(count, label_size, font_size):
+    contexts = []
+    for i in range(count):
+        product = PRODUCTS[i % len(PRODUCTS)]
+        params = {'label_size': label_size, 'font_size': font_size, 'text': product, 'product': product,
+                  'grocycode': 'grcy:p:{}'.format(i), 'duedate': '2024-02-29'}
+        contexts.append(brother_ql_web.label_context_from_params(params))
+    return contexts
+
+
+def bench_in_process(create, contexts):
+    start = time.perf_counter()
+    for context in contexts:
+        create(**context)
+    return time.perf_counter() - start
+
+
+def bench_pool(processes, create, contexts, fonts):
+    pool = RenderPool(processes, warm_up_fonts=fonts)
+    try:
+        # start all workers before measuring
+        for future in [pool.submit(create, **context) for context in contexts[:processes * 2]]:
+            future.result()
+        start = time.perf_counter()
+        futures = [pool.submit(create, **context) for context in contexts]
+        for future in futures:
+            unpack_image(future.result())
+        return time.perf_counter() - start
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--font', default=None, help='.ttf/.otf font to render with (default: the configured default font)')
+    parser.add_argument('--font-size', type=int, default=70)
+    parser.add_argument('--label-size', default='62x29')
+    parser.add_argument('--labels', type=int, default=200, help='Number of labels to render per run')
+    parser.add_argument('--renderer', default='text', choices=sorted(RENDERERS.keys()))
+    parser.add_argument('--max-processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    if args.font:
+        brother_ql_web.FONTS = {'Benchmark': {'Regular': args.font}}
+        brother_ql_web.CONFIG['LABEL']['DEFAULT_FONTS'] = {'family': 'Benchmark', 'style': 'Regular'}
+    else:
+        brother_ql_web.FONTS = get_fonts()
+        for font in brother_ql_web.CONFIG['LABEL']['DEFAULT_FONTS']:
+            if font['style'] in brother_ql_web.FONTS.get(font['family'], {}):
+                brother_ql_web.CONFIG['LABEL']['DEFAULT_FONTS'] = font
+                break
+        else:
+            parser.error('None of the default fonts was found, please use --font')
+    brother_ql_web.CONFIG['LABEL']['DEFAULT_FONT_SIZE'] = args.font_size
+    brother_ql_web.LABEL_GEOMETRY = brother_ql_web.build_label_geometry()
+
+    create = RENDERERS[args.renderer]
+    contexts = make_contexts(args.labels, args.label_size, args.font_size)
+    fonts = [brother_ql_web.get_default_font()]
+
+    # warm the in-process caches the same way the workers are warmed
+    create(**contexts[0])
+    baseline = bench_in_process(create, contexts)
+    print('{:>9} {:>9} {:>10} {:>8}'.format('processes', 'seconds', 'labels/s', 'speedup'))
+    print('{:>9} {:>9.2f} {:>10.1f} {:>8.2f}'.format('in-proc', baseline, args.labels / baseline, 1))
+    for processes in range(1, args.max_processes + 1):
+        duration = bench_pool(processes, create, contexts, fonts)
+        print('{:>9} {:>9.2f} {:>10.1f} {:>8.2f}'.format(processes, duration, args.labels / duration, baseline / duration))
+
+if __name__ == "__main__":
+    main()
@@ -7,11 +7,14 @@ This is a web service to print labels on Brother QL label printers.
 
 import textwrap
 
-import sys, logging, random, json, argparse
+import sys, os, glob, logging, random, json, argparse, time, functools, threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import namedtuple
 from io import BytesIO
+from types import MappingProxyType
 
-from bottle import run, route, get, post, response, request, jinja2_view as view, static_file, redirect
-from PIL import Image, ImageDraw, ImageFont
+from bottle import run, route, get, post, response, request, jinja2_template, static_file, redirect
+from PIL import Image, ImageDraw
 
 from brother_ql.devicedependent import models, label_type_specs, label_sizes
 from brother_ql.devicedependent import ENDLESS_LABEL, DIE_CUT_LABEL, ROUND_DIE_CUT_LABEL
@@ -20,12 +23,31 @@ from brother_ql.backends import backend_factory, guess_backend
 
 from implementation_brother import implementation
 
+from asset_cache import StaticAssets, make_asset, choose_encoding, get_etag, etag_matches, get_version
 from font_helpers import get_fonts
+from limits import RequestRejected, get_limits, count_rejection, get_rejection_counts
+from limits import check_text_length, check_font_size, check_margin, check_pixel_area
+from limits import run_with_deadline, check_deadline
+from render_pool import RenderPool, BrokenProcessPool, unpack_image
+from text_layout import fit_text, get_font, get_glyph_metrics
 
 logger = logging.getLogger(__name__)
 instance = implementation()
 
 LABEL_SIZES = instance.get_label_sizes()
+ORIENTATIONS = ('standard', 'rotated')
+
+LabelGeometry = namedtuple('LabelGeometry', ['kind', 'width', 'height'])
+# (label_size, orientation) -> LabelGeometry, filled by build_label_geometry()
+LABEL_GEOMETRY = MappingProxyType({})
+
+STATIC_ASSETS = StaticAssets('./static')
+# only for URLs carrying the current content hash, see StaticAssets.url()
+STATIC_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# name -> (config key, Asset); cleared by invalidate_page_cache() when the fonts change
+PAGE_CACHE = {}
+# template file -> (mtime, parsed template)
+TEMPLATE_CACHE = {}
 
 try:
     with open('config.json', encoding='utf-8') as fh:
@@ -34,6 +56,11 @@ except FileNotFoundError as e:
     with open('config.example.json', encoding='utf-8') as fh:
         CONFIG = json.load(fh)
 
+LIMITS = get_limits(CONFIG)
+RENDER_EXECUTOR = ThreadPoolExecutor(max_workers=LIMITS['RENDER_THREADS'], thread_name_prefix='render')
+# RenderPool of worker processes, None to render in-process
+RENDER_POOL = None
+RENDER_POOL_LOCK = threading.Lock()
 
 @route('/')
 def index():
@@ -41,20 +68,132 @@ def index():
 
 @route('/static/<filename:path>')
 def serve_static(filename):
-    return static_file(filename, root='./static')
+    asset = STATIC_ASSETS.get(filename)
+    if asset is None:
+        return static_file(filename, root='./static')
+    if request.query.get('v') == get_version(asset):
+        return send_asset(asset, STATIC_CACHE_CONTROL)
+    return send_asset(asset, 'no-cache')
 
 @route('/labeldesigner')
-@view('labeldesigner.jinja2')
 def labeldesigner():
-    font_family_names = sorted(list(FONTS.keys()))
-    return {'font_family_names': font_family_names,
-            'fonts': FONTS,
-            'label_sizes': LABEL_SIZES,
-            'website': CONFIG['WEBSITE'],
-            'label': CONFIG['LABEL']}
+    return send_asset(get_designer_page(), 'no-cache')
+
+@get('/api/fonts')
+def get_font_list():
+    """
+    API endpoint listing the available fonts as family -> [styles].
+
+    returns: JSON
+    """
+    return send_asset(get_font_list_asset(), 'no-cache')
+
+def send_asset(asset, cache_control):
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'), asset.variants)
+    etag = get_etag(asset, encoding)
+    response.set_header('Cache-Control', cache_control)
+    response.set_header('ETag', etag)
+    response.set_header('Vary', 'Accept-Encoding')
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response.status = 304
+        return b''
+    if encoding != 'identity':
+        response.set_header('Content-Encoding', encoding)
+    response.set_header('Content-Type', asset.content_type)
+    return asset.variants[encoding]
+
+def invalidate_page_cache():
+    PAGE_CACHE.clear()
+
+def get_cached_page(name, render, content_type):
+    key = json.dumps([CONFIG, LABEL_SIZES], sort_keys=True, default=str)
+    try:
+        cached_key, asset = PAGE_CACHE[name]
+        if cached_key == key:
+            return asset
+    except KeyError:
+        pass
+    asset = make_asset(render().encode('utf-8'), content_type)
+    PAGE_CACHE[name] = (key, asset)
+    return asset
+
+def get_designer_page():
+    def render():
+        return jinja2_template('labeldesigner.jinja2',
+                               label_sizes=LABEL_SIZES,
+                               website=CONFIG['WEBSITE'],
+                               label=CONFIG['LABEL'],
+                               static_url=STATIC_ASSETS.url)
+    return get_cached_page('labeldesigner', render, 'text/html')
+
+def enforce_limits(callback):
+    """
+    Route decorator answering requests rejected by the resource limits with
+    their HTTP status and a JSON error.
+    """
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        try:
+            return callback(*args, **kwargs)
+        except RequestRejected as e:
+            count_rejection(e.reason)
+            logger.warning('Rejected %s: %s', request.path, e)
+            response.status = e.status
+            return {'success': False, 'error': str(e)}
+    return wrapper
+
+def render_label(create, *args, **kwargs):
+    """
+    Run one of the create_label_* functions in a render worker process (if
+    configured) or a render thread, giving up after LIMITS['RENDER_TIMEOUT'] seconds.
+    """
+    global RENDER_POOL
+    pool = RENDER_POOL
+    if pool is not None:
+        try:
+            return unpack_image(wait_for_render(pool.submit(create, *args, **kwargs)))
+        except BrokenProcessPool:
+            with RENDER_POOL_LOCK:
+                # another request may have dropped or replaced the pool already
+                if RENDER_POOL is pool:
+                    logger.error('A render worker process died, rendering in-process from now on')
+                    RENDER_POOL = None
+                    pool.shutdown()
+        except RequestRejected as e:
+            if e.reason == 'render_time':
+                # the worker is still busy with the render, replace it so it can't block the pool
+                with RENDER_POOL_LOCK:
+                    if RENDER_POOL is pool:
+                        logger.warning('A render timed out, restarting the render worker processes')
+                        RENDER_POOL = pool.restart()
+            raise
+    deadline = time.monotonic() + LIMITS['RENDER_TIMEOUT']
+    return wait_for_render(RENDER_EXECUTOR.submit(run_with_deadline, deadline, create, *args, **kwargs))
+
+def wait_for_render(future):
+    try:
+        return future.result(timeout=LIMITS['RENDER_TIMEOUT'])
+    except FutureTimeoutError:
+        future.cancel()
+        raise RequestRejected('render_time', 'Rendering the label took longer than {} seconds'.format(LIMITS['RENDER_TIMEOUT']), 422)
+
+@get('/api/limits')
+def get_limit_stats():
+    """
+    API endpoint reporting the configured limits and how often they rejected a request.
+
+    returns: JSON
+    """
+    return {'limits': LIMITS, 'rejections': get_rejection_counts()}
+
+def get_font_list_asset():
+    def render():
+        return json.dumps({family: sorted(FONTS[family].keys()) for family in sorted(FONTS.keys())})
+    return get_cached_page('fonts', render, 'application/json')
     
 @get('/api/print/template/<templatefile>')
 @post('/api/print/template/<templatefile>')
+@enforce_limits
 def printtemplate(templatefile):
     return_dict = {'Success': False}
     template_data = get_template_data(templatefile)
@@ -65,16 +204,23 @@ def printtemplate(templatefile):
         return_dict['error'] = e.message
         return return_dict
         
-    im = create_label_from_template(template_data, **context)
+    im = render_label(create_label_from_template, template_data, **context)
     if DEBUG:
         im.save('sample-out.png')
     
     return instance.print_label(im, **context)
     
 def get_template_data(templatefile):
-    template_data = None
+    mtime = os.stat(templatefile).st_mtime
+    try:
+        cached_mtime, template_data = TEMPLATE_CACHE[templatefile]
+        if cached_mtime == mtime:
+            return template_data
+    except KeyError:
+        pass
     with open(templatefile, 'r') as file:
         template_data = json.load(file)
+    TEMPLATE_CACHE[templatefile] = (mtime, template_data)
     return template_data
 
 def create_label_from_template(template, **kwargs):
@@ -89,11 +235,14 @@ def create_label_from_template(template, **kwargs):
     margin_bottom = get_value(template, kwargs, 'margin_bottom', margin_top)
     margins = [margin_left, margin_top, margin_right, margin_bottom]
     
+    check_deadline()
+    check_pixel_area(width, height, LIMITS)
     im = Image.new('RGB', (width, height), 'white')
     draw = ImageDraw.Draw(im)
 
     elements = template.get('elements', [])
     for element in elements:
+        check_deadline()
         element_type = element['type']
         if element_type == 'datamatrix':
             im = element_datamatrix(element, im, margins, dimensions, **kwargs)
@@ -137,26 +286,65 @@ def element_text(element, im, margins, dimensions, **kwargs):
     textoffset = horizontal_offset, vertical_offset
     
     draw = ImageDraw.Draw(im)
+    box = (dimensions[0] - horizontal_offset - margins[2], dimensions[1] - vertical_offset - margins[3])
     
-    wrap = element.get('wrap', None)
-    if wrap is not None:
-        wrapper = textwrap.TextWrapper(width=wrap)
-        data = "\n".join(wrapper.wrap(text = data))
-    
-    shrink = element.get('shrink', False)
-    if shrink:
-        font_size = adjust_font_to_fit(draw, font_path, font_size, data, dimensions, 2, horizontal_offset + margins[2], vertical_offset + margins[3])
+    if element.get('fit', False):
+        data, font_size = fit_text(data, font_path, font_size, box)
+    else:
+        wrap = element.get('wrap', None)
+        if wrap is not None:
+            wrapper = textwrap.TextWrapper(width=wrap)
+            data = "\n".join(wrapper.wrap(text = data))
         
-    font = ImageFont.truetype(font_path, font_size)
+        shrink = element.get('shrink', False)
+        if shrink:
+            data, font_size = fit_text(data, font_path, font_size, box, wrap=False)
+        
+    font = get_font(font_path, font_size)
     
     draw.text(textoffset, data, fill_color, font=font)
     
     return im
     
+def compute_label_geometry(label_size, orientation):
+    """ might raise LookupError() """
+    try:
+        kind = instance.get_label_kind(label_size)
+    except KeyError:
+        raise LookupError("Unknown label_size")
+    width, height = instance.get_label_dimensions(label_size)
+    if height > width: width, height = height, width
+    if orientation == 'rotated': height, width = width, height
+    return LabelGeometry(kind, width, height)
+
+def build_label_geometry():
+    """
+    Precompute the geometry of every configured label size in every orientation.
+    """
+    table = {}
+    for label_size, _ in LABEL_SIZES:
+        for orientation in ORIENTATIONS:
+            table[(label_size, orientation)] = compute_label_geometry(label_size, orientation)
+    return MappingProxyType(table)
+
+def get_label_geometry(label_size, orientation):
+    """ might raise LookupError() """
+    try:
+        return LABEL_GEOMETRY[(label_size, orientation)]
+    except KeyError:
+        return compute_label_geometry(label_size, orientation)
+
 def get_label_context(request):
     """ might raise LookupError() """
 
     d = request.params.decode() # UTF-8 decoded form data
+    return label_context_from_params(d)
+
+def label_context_from_params(d):
+    """ might raise LookupError() or RequestRejected() """
+
+    for name in ('text', 'product', 'due_date', 'duedate', 'grocycode'):
+        check_text_length(name, d.get(name), LIMITS)
 
     provided_font_family =  d.get('font_family')
     if provided_font_family is not None:
@@ -167,25 +355,36 @@ def get_label_context(request):
         font_family = CONFIG['LABEL']['DEFAULT_FONTS']['family']
         font_style = CONFIG['LABEL']['DEFAULT_FONTS']['style']
 
-    context = {
-      'text':          d.get('text', None),
-      'font_size': int(d.get('font_size', 40)),
-      'font_family':   font_family,
-      'font_style':    font_style,
-      'label_size':    d.get('label_size', implementation.get_default_label_size()),
-      'kind':          instance.get_label_kind(d.get('label_size', implementation.get_default_label_size())),
-      'margin':    int(d.get('margin', 10)),
-      'threshold': int(d.get('threshold', 70)),
-      'align':         d.get('align', 'center'),
-      'orientation':   d.get('orientation', 'standard'),
-      'margin_top':    float(d.get('margin_top',    24))/100.,
-      'margin_bottom': float(d.get('margin_bottom', 45))/100.,
-      'margin_left':   float(d.get('margin_left',   35))/100.,
-      'margin_right':  float(d.get('margin_right',  35))/100.,
-      'grocycode': d.get('grocycode', None),
-      'product': d.get('product', None),
-      'duedate': d.get('due_date', d.get('duedate', None))
-    }
+    label_size = d.get('label_size', implementation.get_default_label_size())
+    orientation = d.get('orientation', 'standard')
+    geometry = get_label_geometry(label_size, orientation)
+
+    try:
+        context = {
+          'text':          d.get('text', None),
+          'font_size': int(d.get('font_size', 40)),
+          'font_family':   font_family,
+          'font_style':    font_style,
+          'label_size':    label_size,
+          'kind':          geometry.kind,
+          'margin':    int(d.get('margin', 10)),
+          'threshold': int(d.get('threshold', 70)),
+          'align':         d.get('align', 'center'),
+          'orientation':   orientation,
+          'margin_top':    float(d.get('margin_top',    24))/100.,
+          'margin_bottom': float(d.get('margin_bottom', 45))/100.,
+          'margin_left':   float(d.get('margin_left',   35))/100.,
+          'margin_right':  float(d.get('margin_right',  35))/100.,
+          'grocycode': d.get('grocycode', None),
+          'product': d.get('product', None),
+          'duedate': d.get('due_date', d.get('duedate', None))
+        }
+    except ValueError as e:
+        raise RequestRejected('invalid', 'Invalid parameter: {}'.format(e))
+
+    check_font_size(context['font_size'], LIMITS)
+    for name in ('margin_top', 'margin_bottom', 'margin_left', 'margin_right'):
+        check_margin(name, context[name] * 100, LIMITS)
     context['margin_top']    = int(context['font_size']*context['margin_top'])
     context['margin_bottom'] = int(context['font_size']*context['margin_bottom'])
     context['margin_left']   = int(context['font_size']*context['margin_left'])
@@ -205,16 +404,12 @@ def get_label_context(request):
 
     context['font_path'] = get_font_path(context['font_family'], context['font_style'])
 
-    width, height = instance.get_label_dimensions(context['label_size'])
-    #print(width, ' ', height)
-    if height > width: width, height = height, width
-    if context['orientation'] == 'rotated': height, width = width, height
-    context['width'], context['height'] = width, height
+    context['width'], context['height'] = geometry.width, geometry.height
 
     return context
 
 def create_label_im(text, **kwargs):
-    im_font = ImageFont.truetype(kwargs['font_path'], kwargs['font_size'])
+    im_font = get_font(kwargs['font_path'], kwargs['font_size'])
     im = Image.new('L', (20, 20), 'white')
     draw = ImageDraw.Draw(im)
     # workaround for a bug in multiline_textsize()
@@ -228,45 +423,18 @@ def create_label_im(text, **kwargs):
     textsize = draw.multiline_textbbox((0,0), text, font=im_font)
     textsize = (textsize[2], textsize[3])
     width, height = instance.get_label_width_height(textsize, **kwargs)
-    adjusted_text_size = adjust_font_to_fit(draw, kwargs['font_path'], kwargs['font_size'], text, (width, height), 2, kwargs['margin_left'] + kwargs['margin_right'], kwargs['margin_top'] + kwargs['margin_bottom'])
-    if adjusted_text_size != textsize:
-        im_font = ImageFont.truetype(kwargs['font_path'], adjusted_text_size)
+    check_deadline()
+    check_pixel_area(width, height, LIMITS)
+    box = (width - kwargs['margin_left'] - kwargs['margin_right'], height - kwargs['margin_top'] - kwargs['margin_bottom'])
+    text, adjusted_font_size = fit_text(text, kwargs['font_path'], kwargs['font_size'], box, wrap=False)
+    if adjusted_font_size != kwargs['font_size']:
+        im_font = get_font(kwargs['font_path'], adjusted_font_size)
     im = Image.new('RGB', (width, height), 'white')
     draw = ImageDraw.Draw(im)
     offset = instance.get_label_offset(width, height, textsize, **kwargs)
     draw.multiline_text(offset, text, kwargs['fill_color'], font=im_font, align=kwargs['align'])
     return im
     
-def adjust_font_to_fit(draw, font, max_font_size, text, label_size, min_size = 2, horizontal_offset=0, vertical_offset=0):
-    if min_size >= max_font_size or font_fits(draw, font, max_font_size, text, label_size, horizontal_offset, vertical_offset):
-        return max_font_size
-    high = max_font_size
-    low = min_size
-    
-    while low < high:
-        available_range = high - low
-        mid = (available_range // 2) + low
-        # print('Finding Largest Possible Font between [', low, ',', high, '] with offset of [', horizontal_offset, ',', vertical_offset, '] - Trying: ', mid)
-        fits = font_fits(draw, font, mid, text, label_size, horizontal_offset, vertical_offset)
-        
-        if fits:
-            low = mid + 1
-        else:
-            high = mid
-    
-    if not font_fits(draw, font, mid, text, label_size, horizontal_offset, vertical_offset):
-        mid -= 1
-    
-    # print('Largest font size: ', mid)
-    return mid       
-    
-def font_fits(draw, font, font_size, text, label_size, horizontal_offset, vertical_offset):
-    im_font = ImageFont.truetype(font, font_size)
-    textsize = draw.multiline_textbbox((0,0), text, font=im_font)
-    textsize = (textsize[2], textsize[3])
-    fits = (textsize[0] + horizontal_offset) < label_size[0] and (textsize[1] + vertical_offset) < label_size[1]
-    return fits
-    
 def create_label_grocy(text, **kwargs):
     product = kwargs['product']
     duedate = kwargs['duedate']
@@ -276,17 +444,13 @@ def create_label_grocy(text, **kwargs):
     margin_right = margin_left #kwargs['margin_right']
     margin_bottom = margin_top #kwargs['margin_bottom']
     
-    wrapper = textwrap.TextWrapper(width=25)
-    product = "\n".join(wrapper.wrap(text = product))
-
     # prepare grocycode datamatrix
     from pylibdmtx.pylibdmtx import encode
     encoded = encode(grocycode.encode('utf8'), size="SquareAuto") # adjusted for 300x300 dpi - results in DM code roughly 5x5mm
     datamatrix = Image.frombytes('RGB', (encoded.width, encoded.height), encoded.pixels)
     datamatrix.save('/tmp/dmtx.png')
 
-    product_font = ImageFont.truetype(kwargs['font_path'], kwargs['font_size'])
-    duedate_font = ImageFont.truetype(kwargs['font_path'], int(kwargs['font_size'] * 0.6))
+    product_font = get_font(kwargs['font_path'], kwargs['font_size'])
     
     width, height = instance.get_label_width_height(product_font, **kwargs)
 
@@ -295,6 +459,8 @@ def create_label_grocy(text, **kwargs):
         width = height
         height = tw
 
+    check_deadline()
+    check_pixel_area(width, height, LIMITS)
     im = Image.new('RGB', (width, height), 'white')
     draw = ImageDraw.Draw(im)
     horizontal_offset = 0
@@ -317,25 +483,27 @@ def create_label_grocy(text, **kwargs):
         horizontal_offset += -10
 
     textoffset = horizontal_offset, vertical_offset
-    adjusted_product_font_size = adjust_font_to_fit(draw, kwargs['font_path'], kwargs['font_size'], product, (width, height), 2, horizontal_offset + margin_right, vertical_offset + margin_bottom)
+    box = (width - horizontal_offset - margin_right, height - vertical_offset - margin_bottom)
+    if duedate is not None:
+        # keep a line (plus the gap below the product) free for the due date,
+        # which goes below the product in both orientations
+        duedate_space = get_glyph_metrics(kwargs['font_path'], kwargs['font_size']).line_height + 10
+        box = (box[0], box[1] - duedate_space)
+    product, adjusted_product_font_size = fit_text(product, kwargs['font_path'], kwargs['font_size'], box)
     if kwargs['font_size'] != adjusted_product_font_size:
-        product_font = ImageFont.truetype(kwargs['font_path'], adjusted_product_font_size)
+        product_font = get_font(kwargs['font_path'], adjusted_product_font_size)
     
     draw.text(textoffset, product, kwargs['fill_color'], font=product_font)
 
     if duedate is not None:
         additional_offset = draw.multiline_textbbox((0,0), product, font=product_font)[3] + 10
 
-        if kwargs['orientation'] == 'standard':
-            vertical_offset += additional_offset
-            #horizontal_offset = margin_left
-        elif kwargs['orientation'] == 'rotated':
-            #vertical_offset = margin_left
-            horizontal_offset += additional_offset
+        vertical_offset += additional_offset
         textoffset = horizontal_offset, vertical_offset
         
-        adjusted_duedate_font_size = adjust_font_to_fit(draw, kwargs['font_path'], kwargs['font_size'], duedate, (width, height), 2, horizontal_offset + margin_right, vertical_offset + margin_bottom)
-        duedate_font = ImageFont.truetype(kwargs['font_path'], adjusted_duedate_font_size)
+        box = (width - horizontal_offset - margin_right, height - vertical_offset - margin_bottom)
+        duedate, adjusted_duedate_font_size = fit_text(duedate, kwargs['font_path'], kwargs['font_size'], box, wrap=False)
+        duedate_font = get_font(kwargs['font_path'], adjusted_duedate_font_size)
 
         draw.text(textoffset, duedate, kwargs['fill_color'], font=duedate_font)
 
@@ -343,9 +511,10 @@ def create_label_grocy(text, **kwargs):
 
 @get('/api/preview/text')
 @post('/api/preview/text')
+@enforce_limits
 def get_preview_image():
     context = get_label_context(request)
-    im = create_label_im(**context)
+    im = render_label(create_label_im, **context)
     return_format = request.query.get('return_format', 'png')
     if return_format == 'base64':
         import base64
@@ -358,9 +527,10 @@ def get_preview_image():
 
 @get('/api/preview/grocy')
 @post('/api/preview/grocy')
+@enforce_limits
 def get_preview_grocy_image():
     context = get_label_context(request)
-    im = create_label_grocy(**context)
+    im = render_label(create_label_grocy, **context)
     return_format = request.query.get('return_format', 'png')
     if return_format == 'base64':
         import base64
@@ -372,11 +542,12 @@ def get_preview_grocy_image():
         
 @get('/api/preview/template/<templatefile>')
 @post('/api/preview/template/<templatefile>')
+@enforce_limits
 def get_preview_template_image(templatefile):
     context = get_label_context(request)
     template_data = get_template_data(templatefile)
 
-    im = create_label_from_template(template_data, **context)
+    im = render_label(create_label_from_template, template_data, **context)
     return_format = request.query.get('return_format', 'png')
     if return_format == 'base64':
         import base64
@@ -395,6 +566,7 @@ def image_to_png_bytes(im):
 
 @post('/api/print/grocy')
 @get('/api/print/grocy')
+@enforce_limits
 def print_grocy():
     """
     API endpoint to consume the grocy label webhook.
@@ -413,7 +585,7 @@ def print_grocy():
         return_dict['error'] = 'Please provide the product for the label'
         return return_dict
 
-    im = create_label_grocy(**context)
+    im = render_label(create_label_grocy, **context)
     if DEBUG:
         im.save('sample-out.png')
         
@@ -421,6 +593,7 @@ def print_grocy():
 
 @post('/api/print/text')
 @get('/api/print/text')
+@enforce_limits
 def print_text():
     """
     API to print a label
@@ -443,13 +616,56 @@ def print_text():
         return_dict['error'] = 'Please provide the text for the label'
         return return_dict
 
-    im = create_label_im(**context)
+    im = render_label(create_label_im, **context)
     if DEBUG: im.save('sample-out.png')
 
     return instance.print_label(im, **context)
 
+def get_default_font():
+    """
+    returns: (font path, font size) of the configured default font
+    """
+    font_path = FONTS[CONFIG['LABEL']['DEFAULT_FONTS']['family']][CONFIG['LABEL']['DEFAULT_FONTS']['style']]
+    return font_path, CONFIG['LABEL']['DEFAULT_FONT_SIZE']
+
+def warm_up():
+    """
+    Load fonts, templates and libraries that would otherwise be loaded by the
+    first request, and render a dummy label for every configured label size.
+    """
+    start = time.perf_counter()
+
+    try:
+        from pylibdmtx.pylibdmtx import encode
+        encode('warm-up'.encode('utf8'), size='SquareAuto')
+        datamatrix = True
+    except ImportError:
+        logger.warning('pylibdmtx is not available, skipping DataMatrix warm-up')
+        datamatrix = False
+
+    font_path, font_size = get_default_font()
+    metrics = get_glyph_metrics(font_path, font_size)
+    metrics.width(''.join(chr(c) for c in range(32, 127)))
+
+    get_designer_page()
+    get_font_list_asset()
+    for templatefile in glob.glob('*.lbl'):
+        get_template_data(templatefile)
+
+    for label_size, _ in LABEL_SIZES:
+        for orientation in ORIENTATIONS:
+            params = {'label_size': label_size, 'orientation': orientation, 'font_size': font_size,
+                      'text': 'Warm-up', 'product': 'Warm-up', 'grocycode': 'warm-up', 'duedate': '2000-01-01'}
+            context = label_context_from_params(params)
+            create_label_im(**context)
+            # create_label_grocy doesn't support endless labels
+            if datamatrix and orientation == 'standard' and context['kind'] != ENDLESS_LABEL:
+                create_label_grocy(**context)
+
+    sys.stderr.write('Warm-up finished in {:.1f} ms\n'.format((time.perf_counter() - start) * 1000))
+
 def main():
-    global DEBUG, FONTS, BACKEND_CLASS, CONFIG
+    global DEBUG, FONTS, BACKEND_CLASS, CONFIG, LABEL_GEOMETRY, RENDER_POOL
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument('--port', default=False)
     parser.add_argument('--loglevel', type=lambda x: getattr(logging, x.upper()), default=False)
@@ -457,6 +673,8 @@ def main():
     parser.add_argument('--default-label-size', default=False, help='Label size inserted in your printer. Defaults to 62.')
     parser.add_argument('--default-orientation', default=False, choices=('standard', 'rotated'), help='Label orientation, defaults to "standard". To turn your text by 90°, state "rotated".')
     parser.add_argument('--model', default=False, choices=models, help='The model of your printer (default: QL-500)')
+    parser.add_argument('--warm-up', action='store_true', help='Preload fonts, templates and libraries and render a dummy label per label size before serving requests')
+    parser.add_argument('--render-processes', type=int, default=None, help='Number of worker processes rendering labels. 0 renders in the web server process (default)')
     parser.add_argument('printer',  nargs='?', default=False, help='String descriptor for the printer to use (like tcp://192.168.0.23:9100 or file:///dev/usb/lp0)')
     args = parser.parse_args()
 
@@ -528,6 +746,27 @@ def main():
         CONFIG['LABEL']['DEFAULT_FONTS'] = {'family': family, 'style': style}
         sys.stderr.write('The default font is now set to: {family} ({style})\n'.format(**CONFIG['LABEL']['DEFAULT_FONTS']))
 
+    invalidate_page_cache()
+
+    start = time.perf_counter()
+    static_count = STATIC_ASSETS.precompute()
+    sys.stderr.write('Precomputed {} static files in {:.1f} ms\n'.format(static_count, (time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    LABEL_GEOMETRY = build_label_geometry()
+    sys.stderr.write('Precomputed geometry for {} label sizes in {:.1f} ms\n'.format(len(LABEL_SIZES), (time.perf_counter() - start) * 1000))
+
+    if args.warm_up or CONFIG['SERVER'].get('WARM_UP', False):
+        warm_up()
+
+    if args.render_processes is not None:
+        render_processes = args.render_processes
+    else:
+        render_processes = CONFIG['SERVER'].get('RENDER_PROCESSES', 0)
+    if render_processes > 0:
+        RENDER_POOL = RenderPool(render_processes, warm_up_fonts=[get_default_font()])
+        logger.info('Rendering labels in %d worker processes', render_processes)
+
     run(host=CONFIG['SERVER']['HOST'], port=PORT, debug=DEBUG)
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""
+Resource limits for rendering requests and counters of rejected requests.
+"""
+
+import threading, time
+from collections import Counter
+
+DEFAULT_LIMITS = {
+    'MAX_TEXT_LENGTH': 1000,     # characters per text field
+    'MAX_FONT_SIZE':   500,      # points
+    'MAX_MARGIN':      1000,     # percent of the font size
+    'MAX_PIXELS':      10000000, # width * height of the rendered label
+    'RENDER_TIMEOUT':  10,       # seconds
+    'RENDER_THREADS':  2,
+}
+
+
+class RequestRejected(Exception):
+    """
+    A request exceeded one of the limits (or was otherwise invalid).
+    reason is a short identifier used for the rejection counters,
+    status the HTTP status code to answer with.
+    """
+
+    def __init__(self, reason, message, status=400):
+        super().__init__(message)
+        self.reason = reason
+        self.status = status
+
+    def __reduce__(self):
+        # keep reason and status when raised in a render worker process
+        return (self.__class__, (self.reason, str(self), self.status))
+
+
+_rejections = Counter()
+_rejections_lock = threading.Lock()
+
+# deadline (time.monotonic()) of the render running in the current thread
+_render_deadline = threading.local()
+
+
+def get_limits(config):
+    limits = dict(DEFAULT_LIMITS)
+    limits.update(config.get('LIMITS') or {})
+    return limits
+
+
+def count_rejection(reason):
+    with _rejections_lock:
+        _rejections[reason] += 1
+
+
+def get_rejection_counts():
+    with _rejections_lock:
+        return dict(_rejections)
+
+
+def check_text_length(name, text, limits):
+    if text is not None and len(text) > limits['MAX_TEXT_LENGTH']:
+        raise RequestRejected('text_length', 'The {} is longer than {} characters'.format(name, limits['MAX_TEXT_LENGTH']), 413)
+
+
+def check_font_size(font_size, limits):
+    if not 1 <= font_size <= limits['MAX_FONT_SIZE']:
+        raise RequestRejected('font_size', 'The font size must be between 1 and {}'.format(limits['MAX_FONT_SIZE']))
+
+
+def check_margin(name, margin, limits):
+    if not 0 <= margin <= limits['MAX_MARGIN']:
+        raise RequestRejected('margin', 'The {} must be between 0 and {}'.format(name, limits['MAX_MARGIN']))
+
+
+def run_with_deadline(deadline, create, *args, **kwargs):
+    """
+    Call create with a deadline, which the render loops check with
+    check_deadline() so a render that takes too long frees its thread.
+    """
+    _render_deadline.at = deadline
+    try:
+        return create(*args, **kwargs)
+    finally:
+        _render_deadline.at = None
+
+
+def check_deadline():
+    deadline = getattr(_render_deadline, 'at', None)
+    if deadline is not None and time.monotonic() > deadline:
+        raise RequestRejected('render_time', 'Rendering the label took too long, aborted', 422)
+
+
+def check_pixel_area(width, height, limits):
+    """
+    Call before allocating an image of width x height.
+    """
+    if width * height > limits['MAX_PIXELS']:
+        raise RequestRejected('pixel_area', 'The label would be {}x{} pixels, more than the limit of {} pixels'.format(width, height, limits['MAX_PIXELS']), 413)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""
+Optional pool of worker processes rendering labels outside of the HTTP
+process, so that previews and prints can use more than one core.
+
+Only the render function, its (small) arguments and the packed image
+bytes cross the process boundary. Every worker keeps its own font and
+glyph metric caches, warmed up when the worker starts.
+"""
+
+import logging, time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+from text_layout import get_glyph_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up_worker(fonts):
+    """
+    Initializer of the worker processes: load pylibdmtx and the glyph
+    metrics of the given (font_path, font_size) pairs.
+    """
+    start = time.perf_counter()
+    try:
+        from pylibdmtx.pylibdmtx import encode
+        encode('warm-up'.encode('utf8'), size='SquareAuto')
+    except ImportError:
+        pass
+    printable = ''.join(chr(c) for c in range(32, 127))
+    for font_path, font_size in fonts:
+        get_glyph_metrics(font_path, font_size).width(printable)
+    logger.debug('Render worker warmed up in %.1f ms', (time.perf_counter() - start) * 1000)
+
+
+def render_packed(create, args, kwargs):
+    im = create(*args, **kwargs)
+    return im.mode, im.size, im.tobytes()
+
+
+def unpack_image(packed):
+    mode, size, data = packed
+    return Image.frombytes(mode, size, data)
+
+
+class RenderPool:
+    """
+    Runs create_label_* functions in worker processes.
+    The functions must be defined at module level so they can be pickled.
+    """
+
+    def __init__(self, processes, warm_up_fonts=()):
+        self.processes = processes
+        self.warm_up_fonts = list(warm_up_fonts)
+        self.executor = ProcessPoolExecutor(max_workers=processes, initializer=warm_up_worker,
+                                            initargs=(self.warm_up_fonts,))
+
+    def submit(self, create, *args, **kwargs):
+        """
+        Returns a future of the packed image, see unpack_image().
+        Raises BrokenProcessPool if a worker died.
+        """
+        return self.executor.submit(render_packed, create, args, kwargs)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def terminate(self):
+        """
+        Kill the worker processes, including ones stuck in a render, and shut down.
+        """
+        # ProcessPoolExecutor has no public way to stop a running task
+        for process in list((self.executor._processes or {}).values()):
+            process.terminate()
+        self.shutdown()
+
+    def restart(self):
+        """
+        Terminate this pool and return a new one with the same settings.
+        """
+        self.terminate()
+        return RenderPool(self.processes, self.warm_up_fonts)
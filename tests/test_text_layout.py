@@ -0,0 +1,79 @@
+import os, random
+
+import pytest
+from PIL import ImageFont
+
+from font_helpers import get_fonts
+from text_layout import fit_text, bbox_fits, DUMMY_DRAW
+
+
+def find_font():
+    if os.environ.get('LABEL_WEB_TEST_FONT'):
+        return os.environ['LABEL_WEB_TEST_FONT']
+    try:
+        fonts = get_fonts()
+    except (OSError, FileNotFoundError):
+        fonts = {}
+    for styles in fonts.values():
+        for path in styles.values():
+            return path
+    pytest.skip('no font found, install fontconfig or set LABEL_WEB_TEST_FONT')
+
+
+@pytest.fixture(scope='module')
+def font_path():
+    return find_font()
+
+
+def adjust_font_to_fit(font, max_font_size, text, box, min_size=2):
+    """
+    The bbox based binary search fit_text() replaced, for reference.
+    """
+    def font_fits(font_size):
+        textsize = DUMMY_DRAW.multiline_textbbox((0, 0), text, font=ImageFont.truetype(font, font_size))
+        return textsize[2] < box[0] and textsize[3] < box[1]
+
+    if min_size >= max_font_size or font_fits(max_font_size):
+        return max_font_size
+    low, high = min_size, max_font_size
+    while low < high:
+        mid = (high - low) // 2 + low
+        if font_fits(mid):
+            low = mid + 1
+        else:
+            high = mid
+    if not font_fits(mid):
+        mid -= 1
+    return mid
+
+
+WORDS = ['milk', 'Organic', 'tomatoes', 'basil', 'Äpfel', 'yoghurt', 'jam', 'QUIZ', 'fjord',
+         'pasta', 'Wholegrain', '3.5%', 'gym', 'typography', 'Ave', 'ToTa', 'VAWA']
+
+
+def test_fit_text_not_smaller_than_bbox_search(font_path):
+    rng = random.Random(0)
+    for _ in range(100):
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        box = (rng.randint(100, 800), rng.randint(40, 300))
+        _, font_size = fit_text(text, font_path, 200, box, wrap=False)
+        assert font_size >= adjust_font_to_fit(font_path, 200, text, box), (text, box)
+
+
+def test_fit_text_result_fits(font_path):
+    rng = random.Random(1)
+    for _ in range(100):
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 8)))
+        box = (rng.randint(100, 800), rng.randint(40, 300))
+        for wrap in (False, True):
+            laid_out, font_size = fit_text(text, font_path, 200, box, wrap=wrap)
+            assert font_size == 2 or bbox_fits(laid_out, font_path, font_size, box), (text, box, wrap)
+
+
+def test_fit_text_wraps_at_word_boundaries(font_path):
+    text = 'Chopped tomatoes with basil and oregano in a tin'
+    laid_out, font_size = fit_text(text, font_path, 70, (541, 237))
+    assert laid_out.split() == text.split()
+    assert '\n' in laid_out
+    # wrapping must never give a smaller font than keeping a single line
+    assert font_size >= fit_text(text, font_path, 70, (541, 237), wrap=False)[1]
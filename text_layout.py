@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+"""
+Text layout helpers: choose line breaks and font size together so that
+text fills a box as large as possible.
+
+Measuring is done from per-(font, size) glyph advance tables, so trying a
+candidate layout costs a few sums instead of a full multiline_textbbox().
+"""
+
+import logging
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+from limits import check_deadline
+
+logger = logging.getLogger(__name__)
+
+# Pillow's default spacing between lines for multiline_text()/multiline_textbbox()
+LINE_SPACING = 4
+
+# only used to measure text with multiline_textbbox()
+DUMMY_DRAW = ImageDraw.Draw(Image.new('L', (1, 1)))
+
+
+@lru_cache(maxsize=256)
+def get_font(font_path, font_size):
+    """
+    Return a (cached) ImageFont for the given font file and size.
+    """
+    return ImageFont.truetype(font_path, font_size)
+
+
+class GlyphMetrics:
+    """
+    Glyph advance and ink bottom tables and vertical metrics for one font at
+    one size. The tables are filled in lazily the first time a character is
+    measured.
+    """
+
+    def __init__(self, font_path, font_size):
+        self.font = get_font(font_path, font_size)
+        self.font_size = font_size
+        self._advances = {}
+        self._bottoms = {}
+        ascent, descent = self.font.getmetrics()
+        self.line_height = ascent + descent
+        self.line_pitch = self.font.getbbox('A')[3] + LINE_SPACING
+
+    def advance(self, char):
+        try:
+            return self._advances[char]
+        except KeyError:
+            adv = self._advances[char] = self.font.getlength(char)
+            return adv
+
+    def bottom(self, char):
+        """
+        Lowest ink pixel of char, measured from the top of the line.
+        """
+        try:
+            return self._bottoms[char]
+        except KeyError:
+            bottom = self._bottoms[char] = self.font.getbbox(char)[3]
+            return bottom
+
+    def width(self, line):
+        return sum(self.advance(char) for char in line)
+
+    def height(self, lines):
+        """
+        Bottom of the ink of lines drawn with multiline_text(), like multiline_textbbox()[3].
+        """
+        return max((i * self.line_pitch + max((self.bottom(char) for char in line), default=0)
+                    for i, line in enumerate(lines)), default=0)
+
+
+@lru_cache(maxsize=256)
+def get_glyph_metrics(font_path, font_size):
+    return GlyphMetrics(font_path, font_size)
+
+
+def wrap_lines(text, metrics, max_width):
+    """
+    Greedily break text into lines no wider than max_width.
+    Explicit newlines are kept, words wider than a line are split.
+    """
+    space = metrics.advance(' ')
+    lines = []
+    for paragraph in text.split('\n'):
+        line, line_width = '', 0
+        for word in paragraph.split():
+            word_width = metrics.width(word)
+            if line and line_width + space + word_width < max_width:
+                line += ' ' + word
+                line_width += space + word_width
+                continue
+            if line:
+                lines.append(line)
+            line, line_width = '', 0
+            if word_width >= max_width:
+                # break_long_words, like textwrap
+                for char in word:
+                    char_width = metrics.advance(char)
+                    if line and line_width + char_width >= max_width:
+                        lines.append(line)
+                        line, line_width = '', 0
+                    line += char
+                    line_width += char_width
+            else:
+                line, line_width = word, word_width
+        lines.append(line)
+    return lines
+
+
+def layout_text(text, font_path, font_size, box, wrap=True):
+    """
+    Lay out text at a single font size.
+    Returns the list of lines and whether they fit into box (width, height).
+    """
+    check_deadline()
+    metrics = get_glyph_metrics(font_path, font_size)
+    if wrap:
+        lines = wrap_lines(text, metrics, box[0])
+    else:
+        lines = text.split('\n')
+    text_width = max((metrics.width(line) for line in lines), default=0)
+    fits = text_width < box[0] and metrics.height(lines) < box[1]
+    return lines, fits
+
+
+def bbox_fits(text, font_path, font_size, box):
+    """
+    Check a layout with the real bounding box, which (unlike the advance
+    sums) accounts for kerning and glyph overhang.
+    """
+    bbox = DUMMY_DRAW.multiline_textbbox((0, 0), text, font=get_font(font_path, font_size))
+    return bbox[2] < box[0] and bbox[3] < box[1]
+
+
+def fit_text(text, font_path, max_font_size, box, min_size=2, wrap=True):
+    """
+    Find the largest font size between min_size and max_font_size at which
+    text fits into box (width, height), wrapping it at word boundaries if
+    wrap is set.
+
+    returns: (the laid out text, font size)
+    """
+    lines, fits = layout_text(text, font_path, max_font_size, box, wrap)
+    if min_size >= max_font_size:
+        return '\n'.join(lines), max_font_size
+    if fits and bbox_fits('\n'.join(lines), font_path, max_font_size, box):
+        return '\n'.join(lines), max_font_size
+
+    best = None
+    low, high = min_size, max_font_size - 1
+    while low <= high:
+        mid = (low + high) // 2
+        lines, fits = layout_text(text, font_path, mid, box, wrap)
+        if fits:
+            best = lines, mid
+            low = mid + 1
+        else:
+            high = mid - 1
+
+    if best is None:
+        logger.debug('Text does not fit at the minimum font size %d: %r', min_size, text)
+        lines, _ = layout_text(text, font_path, min_size, box, wrap)
+        best = lines, min_size
+    lines, font_size = best
+    # the advance sums ignore kerning and overhang, so correct the size with the real bounding box
+    if bbox_fits('\n'.join(lines), font_path, font_size, box):
+        while font_size < max_font_size:
+            larger_lines, _ = layout_text(text, font_path, font_size + 1, box, wrap)
+            if not bbox_fits('\n'.join(larger_lines), font_path, font_size + 1, box):
+                break
+            lines, font_size = larger_lines, font_size + 1
+    else:
+        while font_size > min_size:
+            font_size -= 1
+            lines, _ = layout_text(text, font_path, font_size, box, wrap)
+            if bbox_fits('\n'.join(lines), font_path, font_size, box):
+                break
+    return '\n'.join(lines), font_size